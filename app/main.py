@@ -6,8 +6,12 @@ Calls awsconnect.py to convert flowchart images to nodes,then stepsToActionableJ
 import sys
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
+import boto3
+from botocore.config import Config
+
 os.chdir(Path(__file__).parent.parent)
 
 from services.awsconnect import FlowchartProcessor
@@ -16,10 +20,17 @@ from services.stepsToActionableJson import ActionableNodeConverter
 
 class FlowchartPipeline:
     
-    def __init__(self, region: str = "us-east-1"):
+    def __init__(self, region: str = "us-east-1", use_cache: bool = True):
         self.region = region
-        self.processor = FlowchartProcessor(region=region)
-        self.converter = ActionableNodeConverter(region=region)
+        # One client shares its connection pool and loaded service model across both steps
+        self._client = boto3.client(
+            "bedrock-runtime",
+            region_name=region,
+            config=Config(max_pool_connections=32, retries={"mode": "adaptive", "max_attempts": 5},
+                          tcp_keepalive=True)
+        )
+        self.processor = FlowchartProcessor(region=region, use_cache=use_cache, client=self._client)
+        self.converter = ActionableNodeConverter(region=region, use_cache=use_cache, client=self._client)
     
     def process_flowchart(self, image_path: str, output_nodes_file: str = "flowchart_nodes.json",
                           output_actionable_file: str = "actionable_nodes.json", 
@@ -39,6 +50,72 @@ class FlowchartPipeline:
         
         return actionable_nodes
     
+    def process_flowcharts(self, paths: list[str], output_folder: str = "output_jsons",
+                           template_file: str = "template.json", max_workers: int = 8) -> list:
+        """
+        Run the full pipeline for several flowchart images concurrently.
+        
+        The Bedrock client is thread-safe and releases the GIL while waiting on
+        the network, so independent images are processed in a thread pool.
+        
+        Args:
+            paths: Paths to the flowchart image files
+            output_folder: Folder for the per-image nodes and actionable JSON files,
+                named "<index>_<stem>_*.json" so images with the same stem don't collide
+            template_file: Path to the template JSON file
+            max_workers: Maximum number of images processed at once
+            
+        Returns:
+            List of actionable nodes, in the same order as paths
+        """
+        os.makedirs(output_folder, exist_ok=True)
+        
+        def run(i: int, image_path: str):
+            prefix = os.path.join(output_folder, f"{i:03d}_{Path(image_path).stem}")
+            return self.process_flowchart(
+                image_path,
+                output_nodes_file=f"{prefix}_nodes.json",
+                output_actionable_file=f"{prefix}_actionable.json",
+                template_file=template_file
+            )
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, range(len(paths)), paths))
+    
+    def process_pdf(self, pdf_path: str, output_folder: str = "output_jsons",
+                    template_file: str = "template.json", max_workers: int = 8) -> list:
+        """
+        Extract every page of a PDF as an image and run the pipeline on each.
+        
+        Args:
+            pdf_path: Path to the PDF file
+            output_folder: Folder for the per-page nodes and actionable JSON files
+            template_file: Path to the template JSON file
+            max_workers: Maximum number of pages converted at once
+            
+        Returns:
+            List of actionable nodes, one entry per page
+        """
+        # Imported here so pdf2image is only required when PDFs are processed
+        from services.extractImageFromPdf import extract_images_from_pdf
+        
+        image_paths = extract_images_from_pdf(pdf_path)
+        os.makedirs(output_folder, exist_ok=True)
+        
+        # Pages are read in batched requests; the per-page conversions then run concurrently
+        nodes_list = self.processor.images_to_nodes(image_paths)
+        
+        def convert(i: int, image_path: str, nodes_data: dict):
+            prefix = os.path.join(output_folder, f"{i:03d}_{Path(image_path).stem}")
+            nodes_file = f"{prefix}_nodes.json"
+            self.processor.save_nodes_to_file(nodes_data, nodes_file)
+            actionable_nodes = self.converter.convert_nodes(nodes_file, template_file)
+            self.converter.save_to_file(actionable_nodes, f"{prefix}_actionable.json")
+            return actionable_nodes
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(convert, range(len(image_paths)), image_paths, nodes_list))
+    
     def process_flowchart_to_nodes_only(self, image_path: str, 
                                         output_file: str = "flowchart_nodes.json") -> dict:
        
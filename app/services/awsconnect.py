@@ -1,37 +1,173 @@
-import boto3, json, base64
+import boto3, hashlib, io, json, orjson
+from botocore.config import Config
+from pathlib import Path
+from typing import Literal
+from PIL import Image
+from pydantic import BaseModel, ConfigDict, TypeAdapter
+
+try:
+    from services.llm_cache import get_or_compute, settings_key
+    from services.llm_response import clean_response, parse_validated
+except ModuleNotFoundError as e:
+    # Only fall back when run from inside services/; real missing modules still raise
+    if e.name != "services":
+        raise
+    from llm_cache import get_or_compute, settings_key
+    from llm_response import clean_response, parse_validated
+
+
+_PROMPT_TEMPLATE = """
+You are an expert system architect.
+
+Read the flowchart in the image and convert it into structured nodes.
+
+Each node must contain:
+- id
+- name
+- type (start, process, decision, api, end)
+- description
+- connections (array of node ids)
+- actor (caller, agent, system)
+
+Shape the response as:
+{"nodes": [...]}
+
+Output ONLY valid JSON with no markdown formatting, no code blocks, no explanations, no additional text.
+Start your response with { and end with }
+"""
+
+_BATCH_PROMPT_TEMPLATE = """
+You are an expert system architect.
+
+Each of the following images is a separate flowchart, introduced by its number.
+Read every flowchart and convert each one into structured nodes.
+
+Each node must contain:
+- id
+- name
+- type (start, process, decision, api, end)
+- description
+- connections (array of node ids)
+- actor (caller, agent, system)
+
+Return one entry per flowchart, in the same order as the images, shaped as:
+{"flowcharts": [{"nodes": [...]}, {"nodes": [...]}]}
+
+Output ONLY valid JSON with no markdown formatting, no code blocks, no explanations, no additional text.
+Start your response with { and end with }
+"""
+
+
+class Node(BaseModel):
+    # The prompt does not say ids must be strings, so accept numeric ids as well
+    model_config = ConfigDict(coerce_numbers_to_str=True)
+    
+    id: str
+    name: str
+    type: Literal["start", "process", "decision", "api", "end"]
+    description: str | None = ""
+    connections: list[str]
+    actor: Literal["caller", "agent", "system"]
+
+
+class FlowchartNodes(BaseModel):
+    nodes: list[Node]
+
+
+class FlowchartBatch(BaseModel):
+    flowcharts: list[FlowchartNodes]
+
+
+_NODES_ADAPTER = TypeAdapter(FlowchartNodes)
+_BATCH_ADAPTER = TypeAdapter(FlowchartBatch)
 
 
 class FlowchartProcessor:
     """
     A class to process flowchart images and convert them to structured node JSON format
     using AWS Bedrock and Claude AI.
+    
+    Requests to Bedrock (here and in ActionableNodeConverter) use temperature 0 and
+    top_k 1. Claude's output is then near-deterministic, not guaranteed identical,
+    which maximizes the on-disk response cache's hit rate.
     """
     
     MODEL_ARN = "arn:aws:bedrock:us-east-1:302511180962:inference-profile/global.anthropic.claude-opus-4-5-20251101-v1:0"
     
-    def __init__(self, region: str = "us-east-1"):
+    # Images above this size are downscaled before upload; Claude's vision input
+    # does not benefit from a longest edge beyond MAX_IMAGE_EDGE
+    RESIZE_THRESHOLD_BYTES = 1_500_000
+    MAX_IMAGE_EDGE = 1568
+    
+    # Flowcharts sent together in one request by images_to_nodes; a batch containing an
+    # image over Bedrock's per-image limit falls back to one request per image
+    BATCH_SIZE = 10
+    MAX_BATCH_IMAGE_BYTES = 3_750_000
+    
+    # Decoding settings; part of every cache key so changing them invalidates old entries
+    MAX_TOKENS = 2000
+    TEMPERATURE = 0
+    TOP_K = 1
+    
+    def __init__(self, region: str = "us-east-1", use_cache: bool = True, client=None):
         """
         Initialize the FlowchartProcessor.
         
         Args:
             region: AWS region for Bedrock client (default: us-east-1)
+            use_cache: Reuse on-disk responses for identical model/prompt/image inputs
+            client: Existing bedrock-runtime client to reuse (default: create one)
         """
         self.region = region
-        self.client = boto3.client("bedrock-runtime", region_name=region)
+        self.use_cache = use_cache
+        self.client = client or boto3.client(
+            "bedrock-runtime",
+            region_name=region,
+            config=Config(max_pool_connections=16, retries={"mode": "adaptive", "max_attempts": 5})
+        )
     
-    def _load_image_as_base64(self, image_path: str) -> str:
+    def _load_image_bytes(self, image_path: str) -> bytes:
         """
-        Load an image file and convert it to base64 encoding.
+        Load an image file as raw bytes.
         
         Args:
             image_path: Path to the image file
             
         Returns:
-            Base64 encoded string of the image
+            Raw bytes of the image
         """
-        with open(image_path, "rb") as f:
-            img_bytes = f.read()
-            return base64.b64encode(img_bytes).decode("utf-8")
+        return Path(image_path).read_bytes()
+    
+    def _prepare_image(self, img_bytes: bytes) -> bytes:
+        """
+        Downscale and recompress large images before they are uploaded.
+        
+        Args:
+            img_bytes: Raw bytes of the image
+            
+        Returns:
+            PNG bytes no larger than MAX_IMAGE_EDGE on the longest side, or the
+            original bytes if the image is already small
+        """
+        if len(img_bytes) <= self.RESIZE_THRESHOLD_BYTES:
+            return img_bytes
+        
+        with Image.open(io.BytesIO(img_bytes)) as img:
+            if img.mode not in ("RGB", "RGBA", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((self.MAX_IMAGE_EDGE, self.MAX_IMAGE_EDGE), Image.LANCZOS)
+            buffer = io.BytesIO()
+            img.save(buffer, format="PNG", optimize=True)
+        return buffer.getvalue()
+    
+    def _settings_key(self) -> bytes:
+        """
+        Get the model and decoding settings as bytes for use in cache keys.
+        
+        Returns:
+            Canonical JSON bytes of the settings
+        """
+        return settings_key(self.MODEL_ARN, self.MAX_TOKENS, self.TEMPERATURE, self.TOP_K)
     
     def _get_prompt(self) -> str:
         """
@@ -40,22 +176,7 @@ class FlowchartProcessor:
         Returns:
             Prompt string for the LLM
         """
-        return """
-You are an expert system architect.
-
-Read the flowchart in the image and convert it into structured nodes.
-
-Each node must contain:
-- id
-- name
-- type (start, process, decision, api, end)
-- description
-- connections (array of node ids)
-- actor (caller, agent, system)
-
-Output ONLY valid JSON with no markdown formatting, no code blocks, no explanations, no additional text.
-Start your response with { and end with }
-"""
+        return _PROMPT_TEMPLATE
     
     def _clean_response(self, response_text: str) -> str:
         """
@@ -67,10 +188,7 @@ Start your response with { and end with }
         Returns:
             Cleaned response text
         """
-        if response_text.startswith("```"):
-            response_text = response_text.lstrip("`").lstrip("json").lstrip("\n")
-            response_text = response_text.rstrip("`").rstrip("\n")
-        return response_text
+        return clean_response(response_text)
     
     def image_to_nodes(self, image_path: str) -> dict:
         """
@@ -84,52 +202,155 @@ Start your response with { and end with }
             
         Raises:
             JSONDecodeError: If the response cannot be parsed as JSON
+            ValidationError: If the response does not match the node schema, even after repair
         """
-        # Convert image to base64
-        img_base64 = self._load_image_as_base64(image_path)
+        img_bytes = self._load_image_bytes(image_path)
         prompt = self._get_prompt()
         
-        # Prepare the request body
-        body = {
-            "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 2000,
-            "temperature": 0.2,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt},
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": "image/png",
-                                "data": img_base64
-                            }
-                        }
-                    ]
-                }
-            ]
-        }
-        
-        # Invoke the bedrock model
-        response = self.client.invoke_model(
+        if not self.use_cache:
+            return self._invoke(prompt, self._prepare_image(img_bytes))
+        
+        # Keyed on the original bytes so cache hits skip the resize
+        cache_key = self._settings_key() + prompt.encode() + img_bytes
+        return get_or_compute(cache_key, lambda: self._invoke(prompt, self._prepare_image(img_bytes)))
+    
+    def _invoke(self, prompt: str, img_bytes: bytes) -> dict:
+        """
+        Send the prompt and image to Claude and parse the returned nodes.
+        
+        Args:
+            prompt: Prompt text for the LLM
+            img_bytes: PNG bytes of the flowchart, already passed through _prepare_image
+            
+        Returns:
+            Dictionary containing the structured nodes
+        """
+        # The cache point is inert until the prompt reaches llm_cache.PROMPT_CACHE_MIN_TOKENS
+        result = self._converse([
+            {"text": prompt},
+            {"cachePoint": {"type": "default"}},
+            {"image": {"format": "png", "source": {"bytes": img_bytes}}}
+        ], max_tokens=self.MAX_TOKENS)
+        
+        return parse_validated(result, _NODES_ADAPTER, self._repair(self.MAX_TOKENS))
+    
+    def _repair(self, max_tokens: int):
+        """
+        Build the callback parse_validated uses to send its text-only repair prompt.
+        
+        Args:
+            max_tokens: Maximum number of tokens for the repair response
+            
+        Returns:
+            Callable taking the repair prompt and returning the cleaned response
+        """
+        return lambda prompt: self._converse([{"text": prompt}], max_tokens=max_tokens)
+    
+    def _converse(self, content: list, max_tokens: int) -> str:
+        """
+        Send one user message to Claude and return its cleaned text response.
+        
+        Args:
+            content: Converse content blocks for the message
+            max_tokens: Maximum number of tokens to generate
+            
+        Returns:
+            Response text with any markdown fences removed
+        """
+        # Converse takes images as raw bytes, avoiding the base64 size inflation
+        response = self.client.converse_stream(
             modelId=self.MODEL_ARN,
-            contentType="application/json",
-            accept="application/json",
-            body=json.dumps(body)
+            messages=[{"role": "user", "content": content}],
+            inferenceConfig={"maxTokens": max_tokens, "temperature": self.TEMPERATURE},
+            additionalModelRequestFields={"top_k": self.TOP_K}
         )
         
-        response_body = json.loads(response.get("body").read())
-        result = response_body["content"][0]["text"]
+        # Collect text deltas as they arrive rather than waiting for the whole body
+        parts = []
+        for event in response["stream"]:
+            delta = event.get("contentBlockDelta")
+            if delta and "text" in delta["delta"]:
+                parts.append(delta["delta"]["text"])
+        
+        return self._clean_response("".join(parts))
+    
+    def images_to_nodes(self, image_paths: list[str]) -> list[dict]:
+        """
+        Convert several flowchart images to structured node data, sending up to
+        BATCH_SIZE images per request so the prompt is paid for once per batch.
+        
+        Args:
+            image_paths: Paths to the flowchart image files
+            
+        Returns:
+            List of node dictionaries, in the same order as image_paths
+            
+        Raises:
+            JSONDecodeError: If a response cannot be parsed as JSON
+            ValidationError: If a response does not match the node schema, even after repair
+            ValueError: If a response does not contain one entry per image
+        """
+        results = []
+        
+        for start in range(0, len(image_paths), self.BATCH_SIZE):
+            batch_paths = image_paths[start:start + self.BATCH_SIZE]
+            raw_images = [self._load_image_bytes(path) for path in batch_paths]
+            
+            if not self.use_cache:
+                batch_result = self._process_batch(raw_images)
+            else:
+                # Keyed on the original bytes so a cached batch skips the resize
+                cache_key = b"".join(
+                    [self._settings_key(), _BATCH_PROMPT_TEMPLATE.encode()]
+                    + [hashlib.sha256(img).digest() for img in raw_images]
+                )
+                batch_result = get_or_compute(cache_key, lambda: self._process_batch(raw_images))
+            
+            results.extend(batch_result["flowcharts"])
+        
+        return results
+    
+    def _process_batch(self, raw_images: list[bytes]) -> dict:
+        """
+        Prepare a batch of images and send them in one request, or one request per
+        image if any prepared image is over MAX_BATCH_IMAGE_BYTES.
+        
+        Args:
+            raw_images: Raw bytes of each flowchart image
+            
+        Returns:
+            Dictionary with a "flowcharts" list holding one node dictionary per image
+        """
+        images = [self._prepare_image(img) for img in raw_images]
+        
+        if any(len(img) > self.MAX_BATCH_IMAGE_BYTES for img in images):
+            prompt = self._get_prompt()
+            return {"flowcharts": [self._invoke(prompt, img) for img in images]}
+        
+        return self._invoke_batch(images)
+    
+    def _invoke_batch(self, images: list[bytes]) -> dict:
+        """
+        Send several prepared images to Claude in one request and parse the returned nodes.
+        
+        Args:
+            images: PNG bytes of each flowchart, already passed through _prepare_image
+            
+        Returns:
+            Dictionary with a "flowcharts" list holding one node dictionary per image
+        """
+        content = [{"text": _BATCH_PROMPT_TEMPLATE}, {"cachePoint": {"type": "default"}}]
+        for i, img_bytes in enumerate(images, start=1):
+            content.append({"text": f"Flowchart {i}:"})
+            content.append({"image": {"format": "png", "source": {"bytes": img_bytes}}})
         
-        result = self._clean_response(result)
+        result = self._converse(content, max_tokens=self.MAX_TOKENS * len(images))
+        parsed = parse_validated(result, _BATCH_ADAPTER, self._repair(self.MAX_TOKENS * len(images)))
         
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON. Error: {e}")
-            raise
+        flowcharts = parsed["flowcharts"]
+        if len(flowcharts) != len(images):
+            raise ValueError(f"Expected {len(images)} flowcharts in response, got {len(flowcharts)}")
+        return parsed
     
     def save_nodes_to_file(self, nodes: dict, output_file: str) -> None:
         """
@@ -139,8 +360,7 @@ Start your response with { and end with }
             nodes: Dictionary containing the nodes data
             output_file: Path to the output JSON file
         """
-        with open(output_file, "w") as f:
-            json.dump(nodes, f, indent=2)
+        Path(output_file).write_bytes(orjson.dumps(nodes, option=orjson.OPT_INDENT_2))
         print(f"Flowchart nodes saved to {output_file}")
 
 
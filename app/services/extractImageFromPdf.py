@@ -1,11 +1,21 @@
 import os
+import shutil
 import sys
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
 from PIL import Image
 
 
+@lru_cache(maxsize=1)
 def find_poppler_path():
+    pdftoppm = shutil.which("pdftoppm")
+    if pdftoppm:
+        path = str(Path(pdftoppm).parent)
+        print(f"[OK] Found poppler at: {path}")
+        return path
+    
     common_paths = [
         r"C:\Users\rakshithas\Downloads\Release-25.12.0-0\poppler-25.12.0\Library\bin",
         r"C:\Program Files\poppler\bin",
@@ -22,7 +32,14 @@ def find_poppler_path():
     return None
 
 
-def extract_images_from_pdf(pdf_path, output_folder="extracted_images", poppler_path=None):
+def _save_page(output_path, image):
+    # Pages are intermediate artifacts, so trade a little file size for a much faster encode
+    image.save(output_path, "PNG", optimize=False, compress_level=1)
+    print(f"  [OK] Extracted: {output_path}")
+    return output_path
+
+
+def extract_images_from_pdf(pdf_path, output_folder="extracted_images", poppler_path=None, page_batch_size=None):
     
     os.makedirs(output_folder, exist_ok=True)
     
@@ -34,18 +51,26 @@ def extract_images_from_pdf(pdf_path, output_folder="extracted_images", poppler_
             print("Poppler not found in common locations")
     
     try:
+        convert_kwargs = {"dpi": 300, "thread_count": os.cpu_count() or 1}
         if poppler_path and os.path.exists(poppler_path):
-            images = convert_from_path(pdf_path, dpi=300, poppler_path=poppler_path)
+            convert_kwargs["poppler_path"] = poppler_path
+        
+        # Render in page ranges when requested so only one batch is held in memory at a time
+        if page_batch_size:
+            page_count = pdfinfo_from_path(pdf_path, poppler_path=convert_kwargs.get("poppler_path"))["Pages"]
+            page_ranges = [(first, min(first + page_batch_size - 1, page_count))
+                           for first in range(1, page_count + 1, page_batch_size)]
         else:
-            images = convert_from_path(pdf_path, dpi=300)
+            page_ranges = [(None, None)]
         
         extracted_files = []
         
-        for i, image in enumerate(images):
-            output_path = os.path.join(output_folder, f"page_{i+1:03d}.png")
-            image.save(output_path, "PNG")
-            extracted_files.append(output_path)
-            print(f"  [OK] Extracted: {output_path}")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for first_page, last_page in page_ranges:
+                images = convert_from_path(pdf_path, first_page=first_page, last_page=last_page, **convert_kwargs)
+                offset = (first_page or 1) - 1
+                output_paths = [os.path.join(output_folder, f"page_{offset+i+1:03d}.png") for i in range(len(images))]
+                extracted_files.extend(executor.map(_save_page, output_paths, images))
         
         print(f"\nTotal images extracted: {len(extracted_files)}")
         return extracted_files
@@ -0,0 +1,64 @@
+import hashlib, orjson, os, tempfile
+from pathlib import Path
+from typing import Callable
+
+
+CACHE_DIR = Path.home() / ".auflow_cache"
+
+# Bump when request settings or response handling change in a way the keys don't capture
+CACHE_VERSION = 2
+
+# Bedrock prompt caching (the cache_control / cachePoint markers in the services) only
+# applies to a prefix of at least this many tokens; this is the minimum for Claude Opus 4.5,
+# the model in MODEL_ARN. The current prompt prefixes are well below it, so the markers
+# are inert until the prompts grow past it.
+PROMPT_CACHE_MIN_TOKENS = 4096
+
+
+def settings_key(model: str, max_tokens: int, temperature: float, top_k: int) -> bytes:
+    """
+    Encode the model and decoding settings for use at the start of a cache key.
+
+    Args:
+        model: Bedrock model or inference profile ARN
+        max_tokens: Maximum number of tokens the request may generate
+        temperature: Sampling temperature
+        top_k: Top-k sampling limit
+
+    Returns:
+        Canonical JSON bytes of the settings
+    """
+    return orjson.dumps({
+        "model": model,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+        "top_k": top_k
+    })
+
+
+def get_or_compute(key_bytes: bytes, fn: Callable[[], dict]) -> dict:
+    """
+    Return the cached result for key_bytes, calling fn and storing its result on a miss.
+
+    Args:
+        key_bytes: Raw bytes identifying the request (model, prompt and inputs)
+        fn: Zero-argument callable that produces the result on a cache miss
+
+    Returns:
+        The cached or freshly computed result
+    """
+    digest = hashlib.sha256(f"v{CACHE_VERSION}\n".encode() + key_bytes).hexdigest()
+    cache_file = CACHE_DIR / f"{digest}.json"
+
+    if cache_file.exists():
+        return orjson.loads(cache_file.read_bytes())
+
+    result = fn()
+
+    # Write to a temp file first so a concurrent reader never sees a partial entry
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", dir=CACHE_DIR, suffix=".tmp", delete=False) as f:
+        f.write(orjson.dumps(result))
+    os.replace(f.name, cache_file)
+
+    return result
@@ -0,0 +1,75 @@
+import json, orjson, re
+from typing import Any, Callable
+from pydantic import TypeAdapter, ValidationError
+
+
+_FIX_PROMPT_TEMPLATE = """
+The JSON below was meant to match the given JSON schema but failed validation.
+Return the corrected JSON only, keeping all of its content that already fits the schema.
+
+SCHEMA:
+{schema}
+
+VALIDATION ERROR:
+{error}
+
+JSON:
+{response}
+
+Output ONLY valid JSON with no markdown formatting, no code blocks, no explanations, no additional text.
+"""
+
+
+# Matches a leading ``` or ```json fence and a trailing ``` fence around the response
+_FENCE_RE = re.compile(r"^\s*```(?:json)?\s*|\s*```\s*$")
+
+
+def clean_response(response_text: str) -> str:
+    """
+    Remove a markdown code fence wrapped around a model response, if present.
+
+    Args:
+        response_text: Raw response text from the model
+
+    Returns:
+        Response text without the fence
+    """
+    return _FENCE_RE.sub("", response_text)
+
+
+def parse_validated(result: str, adapter: TypeAdapter, repair: Callable[[str], str]) -> Any:
+    """
+    Parse a response and validate it. On failure, ask the model once to repair just
+    the JSON instead of repeating the original request with its full prompt.
+
+    Args:
+        result: Cleaned response text
+        adapter: Pydantic TypeAdapter for the expected shape
+        repair: Sends a text-only prompt to the model and returns its cleaned response
+
+    Returns:
+        The validated data, dumped back to plain JSON types
+
+    Raises:
+        JSONDecodeError: If the repaired response cannot be parsed as JSON
+        ValidationError: If the repaired response still does not match the schema
+    """
+    try:
+        return adapter.dump_python(adapter.validate_python(orjson.loads(result)))
+    except (orjson.JSONDecodeError, ValidationError) as e:
+        print(f"Response failed validation, requesting a fix. Error: {e}")
+        error = str(e)
+
+    prompt = _FIX_PROMPT_TEMPLATE.format(
+        schema=json.dumps(adapter.json_schema(), indent=2),
+        error=error,
+        response=result
+    )
+    fixed = repair(prompt)
+
+    try:
+        parsed = orjson.loads(fixed)
+    except orjson.JSONDecodeError as e:
+        print(f"Failed to parse repaired JSON. Error: {e}")
+        raise
+    return adapter.dump_python(adapter.validate_python(parsed))
@@ -1,27 +1,22 @@
-import boto3, json, base64
+import boto3, json, orjson, os
+from botocore.config import Config
+from pathlib import Path
+from typing import Any
+from pydantic import TypeAdapter
 
+try:
+    from services.llm_cache import get_or_compute, settings_key
+    from services.llm_response import clean_response, parse_validated
+except ModuleNotFoundError as e:
+    # Only fall back when run from inside services/; real missing modules still raise
+    if e.name != "services":
+        raise
+    from llm_cache import get_or_compute, settings_key
+    from llm_response import clean_response, parse_validated
 
-class ActionableNodeConverter:
-    
-    MODEL_ARN = "arn:aws:bedrock:us-east-1:302511180962:inference-profile/global.anthropic.claude-opus-4-5-20251101-v1:0"
-    
-    def __init__(self, region: str = "us-east-1"):
-        self.region = region
-        self.client = boto3.client("bedrock-runtime", region_name=region)
-    
-    def _load_json_file(self, file_path: str) -> dict:
-        with open(file_path, "r") as f:
-            return json.load(f)
-    
-    def _get_conversion_prompt(self, template_data: dict, nodes_data: dict) -> str:
-        return f"""
-You are an expert system architect. Convert the following IVR flowchart nodes into actionable JSON format.
 
-TEMPLATE (use this structure for each node):
-{json.dumps(template_data, indent=2)}
-
-FLOWCHART NODES (convert these):
-{json.dumps(nodes_data, indent=2)}
+_CONVERSION_INSTRUCTIONS = """
+You are an expert system architect. Convert the IVR flowchart nodes given below into actionable JSON format.
 
 Instructions:
 - For each node in the flowchart, create a JSON object following the template structure
@@ -42,58 +37,129 @@ Instructions:
 Output ONLY valid JSON with no markdown formatting, no code blocks, no explanations.
 Start with [ and end with ]
 """
+
+_TEMPLATE_HEADER = "\nTEMPLATE (use this structure for each node):\n"
+_NODES_HEADER = "FLOWCHART NODES (convert these):\n"
+
+# Only the top-level shape is checked; the fields follow the user-supplied template
+_ACTIONABLE_ADAPTER = TypeAdapter(list[dict[str, Any]])
+
+
+class ActionableNodeConverter:
+    """
+    Converts structured flowchart nodes into actionable JSON following a template,
+    using AWS Bedrock and Claude AI.
+    """
+    
+    MODEL_ARN = "arn:aws:bedrock:us-east-1:302511180962:inference-profile/global.anthropic.claude-opus-4-5-20251101-v1:0"
+    
+    # Decoding settings; part of every cache key so changing them invalidates old entries
+    MAX_TOKENS = 4000
+    TEMPERATURE = 0
+    TOP_K = 1
+    
+    def __init__(self, region: str = "us-east-1", use_cache: bool = True, client=None):
+        self.region = region
+        self.use_cache = use_cache
+        self.client = client or boto3.client(
+            "bedrock-runtime",
+            region_name=region,
+            config=Config(max_pool_connections=16, retries={"mode": "adaptive", "max_attempts": 5})
+        )
+        # (path, mtime) -> (parsed template, pretty-printed template)
+        self._template_cache: dict[tuple[str, float], tuple[dict, str]] = {}
+    
+    def _load_json_file(self, file_path: str) -> dict:
+        return orjson.loads(Path(file_path).read_bytes())
+    
+    def _load_template(self, template_file: str) -> tuple[dict, str]:
+        # Batch runs convert many node files against the same template, so parse and
+        # pretty-print it once per file version instead of on every call
+        key = (template_file, os.path.getmtime(template_file))
+        if key not in self._template_cache:
+            template_data = self._load_json_file(template_file)
+            self._template_cache[key] = (template_data, json.dumps(template_data, indent=2))
+        return self._template_cache[key]
+    
+    def _settings_key(self) -> bytes:
+        return settings_key(self.MODEL_ARN, self.MAX_TOKENS, self.TEMPERATURE, self.TOP_K)
+    
+    def _get_conversion_prompt(self, template_json: str, nodes_data: dict) -> list:
+        # The instructions and template are identical across runs, so they go first
+        # and are marked for Bedrock prompt caching; only the nodes block varies.
+        # The marker is inert until the prefix reaches llm_cache.PROMPT_CACHE_MIN_TOKENS.
+        static_prefix = _CONVERSION_INSTRUCTIONS + _TEMPLATE_HEADER + template_json
+        return [
+            {"type": "text", "text": static_prefix, "cache_control": {"type": "ephemeral"}},
+            {"type": "text", "text": _NODES_HEADER + json.dumps(nodes_data, indent=2)}
+        ]
     
     def _clean_response(self, response_text: str) -> str:
-        if response_text.startswith("```"):
-            response_text = response_text.lstrip("`").lstrip("json").lstrip("\n")
-            response_text = response_text.rstrip("`").rstrip("\n")
-        return response_text
+        return clean_response(response_text)
     
     def convert_nodes(self, nodes_file: str, template_file: str) -> dict:
         nodes_data = self._load_json_file(nodes_file)
-        template_data = self._load_json_file(template_file)
+        template_data, template_json = self._load_template(template_file)
         
         # Generate prompt
-        prompt = self._get_conversion_prompt(template_data, nodes_data)
+        content = self._get_conversion_prompt(template_json, nodes_data)
+        
+        if not self.use_cache:
+            return self._invoke(content)
+        
+        cache_key = b"\n".join([
+            self._settings_key(),
+            orjson.dumps(nodes_data, option=orjson.OPT_SORT_KEYS),
+            orjson.dumps(template_data, option=orjson.OPT_SORT_KEYS),
+            _CONVERSION_INSTRUCTIONS.encode(),
+        ])
+        return get_or_compute(cache_key, lambda: self._invoke(content))
+    
+    def _invoke(self, content: list) -> dict:
+        result = self._request(content)
         
+        # A malformed or truncated array gets one text-only repair request instead of
+        # resending the whole conversion prompt
+        return parse_validated(
+            result,
+            _ACTIONABLE_ADAPTER,
+            lambda prompt: self._request([{"type": "text", "text": prompt}])
+        )
+    
+    def _request(self, content: list) -> str:
         # Prepare request body
         body = {
             "anthropic_version": "bedrock-2023-05-31",
-            "max_tokens": 4000,
-            "temperature": 0.2,
+            "max_tokens": self.MAX_TOKENS,
+            "temperature": self.TEMPERATURE,
+            "top_k": self.TOP_K,
             "messages": [
                 {
                     "role": "user",
-                    "content": [
-                        {"type": "text", "text": prompt}
-                    ]
+                    "content": content
                 }
             ]
         }
         
         # Invoke the bedrock model
-        response = self.client.invoke_model(
+        response = self.client.invoke_model_with_response_stream(
             modelId=self.MODEL_ARN,
             contentType="application/json",
             accept="application/json",
-            body=json.dumps(body)
+            body=orjson.dumps(body)
         )
         
-        response_body = json.loads(response.get("body").read())
-        result = response_body["content"][0]["text"]
-        
-        result = self._clean_response(result)
+        # Collect text deltas as they arrive rather than waiting for the whole body
+        parts = []
+        for event in response["body"]:
+            chunk = orjson.loads(event["chunk"]["bytes"])
+            if chunk["type"] == "content_block_delta" and chunk["delta"]["type"] == "text_delta":
+                parts.append(chunk["delta"]["text"])
         
-        try:
-            return json.loads(result)
-        except json.JSONDecodeError as e:
-            print(f"Failed to parse JSON. Error: {e}")
-            print(f"Result content: {result[:500]}")
-            raise
+        return self._clean_response("".join(parts))
     
     def save_to_file(self, data: dict, output_file: str) -> None:
-        with open(output_file, "w") as f:
-            json.dump(data, f, indent=2)
+        Path(output_file).write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2))
         print(f"Actionable nodes saved to {output_file}")
 
 
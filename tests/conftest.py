@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# main.py runs with app/ on sys.path and imports "services.*"; mirror that for tests
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "app"))
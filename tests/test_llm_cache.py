@@ -0,0 +1,39 @@
+import pytest
+
+from services import llm_cache
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(llm_cache, "CACHE_DIR", tmp_path)
+    return tmp_path
+
+
+def test_get_or_compute_only_calls_fn_on_miss():
+    calls = []
+
+    def fn():
+        calls.append(1)
+        return {"nodes": [{"id": "1"}]}
+
+    first = llm_cache.get_or_compute(b"key", fn)
+    second = llm_cache.get_or_compute(b"key", fn)
+
+    assert first == second == {"nodes": [{"id": "1"}]}
+    assert len(calls) == 1
+
+
+def test_get_or_compute_does_not_cache_failures(cache_dir):
+    def fail():
+        raise ValueError("bad response")
+
+    with pytest.raises(ValueError):
+        llm_cache.get_or_compute(b"key", fail)
+
+    assert list(cache_dir.iterdir()) == []
+
+
+def test_settings_key_changes_with_decoding_settings():
+    model = "arn:model"
+
+    assert llm_cache.settings_key(model, 2000, 0, 1) != llm_cache.settings_key(model, 2000, 0.2, 1)
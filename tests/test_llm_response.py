@@ -0,0 +1,23 @@
+import orjson
+
+from services.llm_response import clean_response
+
+
+def test_clean_response_strips_json_fence_without_eating_payload():
+    # lstrip("json") used to strip the leading "n" of "name" along with the fence
+    fenced = '```json\n{"name": "Start", "nodes": []}\n```'
+
+    assert orjson.loads(clean_response(fenced)) == {"name": "Start", "nodes": []}
+
+
+def test_clean_response_keeps_leading_json_letters_after_fence():
+    # The old character-set lstrip turned "```null```" into "ull"
+    assert clean_response("```null```") == "null"
+
+
+def test_clean_response_strips_bare_fence():
+    assert clean_response("```\n[1, 2]\n```\n") == "[1, 2]"
+
+
+def test_clean_response_leaves_unfenced_text_alone():
+    assert clean_response('{"nodes": []}') == '{"nodes": []}'